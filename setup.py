@@ -33,7 +33,10 @@ setup(
     packages=setuptools.find_packages(),
     package_data={module_name: [str(p.relative_to(module_dir)) for p in data_files]},
     install_requires=requirements,
-    extras_require={"limited": ["PyYAML>=6,<7", "rapidfuzz==3.3.1", "hassil==1.2.5"]},
+    extras_require={
+        "limited": ["PyYAML>=6,<7", "rapidfuzz==3.3.1", "hassil==1.2.5"],
+        "orjson": ["orjson>=3,<4"],
+    },
     classifiers=[
         "Development Status :: 3 - Alpha",
         "Intended Audience :: Developers",
@@ -0,0 +1,52 @@
+"""Tests for sentence templates and correction"""
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from wyoming_vosk.sentences import correct_sentence, load_sentences_for_language
+
+_SENTENCES_YAML = """
+sentences:
+  - turn on the light
+  - in: lou mo ss
+    out: turn on all the lights
+"""
+
+
+def test_correct_sentence(tmp_path: Path) -> None:
+    sentences_dir = tmp_path / "sentences"
+    sentences_dir.mkdir()
+    (sentences_dir / "en.yaml").write_text(_SENTENCES_YAML, encoding="utf-8")
+
+    config = load_sentences_for_language(sentences_dir, "en", tmp_path / "db")
+    assert config is not None
+    assert set(config.words) == {"turn", "on", "the", "light", "lou", "mo", "ss"}
+
+    assert correct_sentence("turn on the lite", config) == "turn on the light"
+    db_conn = config.get_db_conn()
+
+    # Output text is used, and the database connection is shared
+    assert correct_sentence("lou mo", config) == "turn on all the lights"
+    assert config.get_db_conn() is db_conn
+
+    # Connection is read-only
+    with pytest.raises(sqlite3.OperationalError):
+        db_conn.execute("DELETE FROM sentences")
+
+
+def test_reload_closes_connection(tmp_path: Path) -> None:
+    sentences_dir = tmp_path / "sentences"
+    sentences_dir.mkdir()
+    sentences_path = sentences_dir / "en.yaml"
+    sentences_path.write_text(_SENTENCES_YAML, encoding="utf-8")
+
+    config = load_sentences_for_language(sentences_dir, "en", tmp_path / "db")
+    assert config is not None
+    assert correct_sentence("turn on the lite", config) == "turn on the light"
+
+    sentences_path.write_text("sentences:\n  - turn off the light\n", encoding="utf-8")
+    new_config = load_sentences_for_language(sentences_dir, "en", tmp_path / "db")
+    assert new_config is not None
+    assert new_config is not config
+    assert correct_sentence("turn of the lite", new_config) == "turn off the light"
@@ -0,0 +1,197 @@
+"""Tests for model and recognizer management without downloading models"""
+import argparse
+import json
+from pathlib import Path
+from typing import Any, Dict
+
+import pytest
+from wyoming.info import Info
+
+from wyoming_vosk import __main__ as vosk_main
+from wyoming_vosk.download import MODELS
+
+
+class FakeModel:
+    """Stands in for vosk.Model."""
+
+    def __init__(self, model_path: str) -> None:
+        self.model_path = model_path
+
+
+class FakeRecognizer:
+    """Stands in for vosk.KaldiRecognizer."""
+
+    def __init__(self, model: FakeModel, rate: int, grammar: Any = None) -> None:
+        self.model = model
+        self.rate = rate
+        self.grammar = grammar
+        self.num_resets = 0
+
+    def Reset(self) -> None:  # pylint: disable=invalid-name
+        self.num_resets += 1
+
+
+@pytest.fixture(name="make_state")
+def fixture_make_state(monkeypatch, tmp_path: Path):
+    monkeypatch.setattr(vosk_main, "Model", FakeModel)
+    monkeypatch.setattr(vosk_main, "KaldiRecognizer", FakeRecognizer)
+
+    data_dir = tmp_path / "data"
+    model_dirs = {}
+    for model_names in MODELS.values():
+        for model_name in model_names:
+            model_dir = data_dir / model_name
+            model_dir.mkdir(parents=True)
+            model_dirs[model_name] = model_dir
+
+    def make_state(**kwargs) -> vosk_main.State:
+        args = argparse.Namespace(
+            data_dir=[str(data_dir)],
+            download_dir=str(data_dir),
+            model_dirs=dict(model_dirs),
+            model_for_language={},
+            model_index=0,
+            casing_for_language={},
+            sentences_dir=None,
+            database_dir=None,
+            limit_sentences=False,
+            allow_unknown=False,
+            max_loaded_models=0,
+        )
+        for key, value in kwargs.items():
+            setattr(args, key, value)
+
+        return vosk_main.State(args, Info())
+
+    return make_state
+
+
+def write_sentences(tmp_path: Path, language: str, text: str) -> Dict[str, Any]:
+    """Writes sentences YAML and returns State args that limit to it."""
+    sentences_dir = tmp_path / "sentences"
+    sentences_dir.mkdir(exist_ok=True)
+    (sentences_dir / f"{language}.yaml").write_text(text, encoding="utf-8")
+
+    return {
+        "sentences_dir": str(sentences_dir),
+        "database_dir": str(tmp_path / "db"),
+        "limit_sentences": True,
+    }
+
+
+@pytest.mark.asyncio
+async def test_pooled_recognizer_reused(make_state, tmp_path: Path) -> None:
+    sentences_dir = tmp_path / "sentences"
+    sentences_dir.mkdir()
+    sentences_path = sentences_dir / "en.yaml"
+    sentences_path.write_text("sentences:\n  - turn on the light\n", encoding="utf-8")
+
+    state = make_state(
+        sentences_dir=str(sentences_dir),
+        database_dir=str(tmp_path / "db"),
+        limit_sentences=True,
+    )
+
+    model_name, limited_str, recognizer = await state.get_recognizer("en")
+    assert limited_str is not None
+    assert set(json.loads(limited_str)) == {"turn", "on", "the", "light"}
+    assert recognizer.grammar is limited_str
+
+    # Same recognizer is handed out again after release
+    state.release_recognizer("en", model_name, limited_str, recognizer)
+    _, limited_str_2, recognizer_2 = await state.get_recognizer("en")
+    assert recognizer_2 is recognizer
+    assert limited_str_2 is limited_str
+    assert recognizer.num_resets == 1
+
+    # Changing the sentences discards pooled recognizers
+    state.release_recognizer("en", model_name, limited_str, recognizer)
+    sentences_path.write_text(
+        "sentences:\n  - turn on the light\n  - turn off the light\n",
+        encoding="utf-8",
+    )
+    _, limited_str_3, recognizer_3 = await state.get_recognizer("en")
+    assert recognizer_3 is not recognizer
+    assert limited_str_3 is not None
+    assert "off" in json.loads(limited_str_3)
+    assert not state.recognizer_pool[(model_name, "en")]
+
+
+@pytest.mark.asyncio
+async def test_unload_least_recently_used(make_state) -> None:
+    state = make_state(max_loaded_models=2)
+
+    await state.get_model("de")
+    await state.get_model("fr")
+    await state.get_model("de")  # fr is now least recently used
+    await state.get_model("it")
+
+    assert list(state.models) == [MODELS["de"][0], MODELS["it"][0]]
+
+
+@pytest.mark.asyncio
+async def test_pinned_model_kept(make_state) -> None:
+    state = make_state(max_loaded_models=1)
+
+    await state.get_model("de")
+    state.pinned_models.add(MODELS["de"][0])
+    await state.get_model("fr")
+    await state.get_model("it")
+
+    assert list(state.models) == [MODELS["de"][0], MODELS["it"][0]]
+
+
+@pytest.mark.asyncio
+async def test_in_use_model_kept(make_state) -> None:
+    state = make_state(max_loaded_models=1)
+
+    # Recognizer for de is in use while fr is loaded
+    model_name, limited_str, recognizer = await state.get_recognizer("de")
+    await state.get_model("fr")
+    assert list(state.models) == [model_name, MODELS["fr"][0]]
+
+    # Released recognizer is pooled with the model it was built from
+    state.release_recognizer("de", model_name, limited_str, recognizer)
+    _, _, pooled_recognizer = await state.get_recognizer("de")
+    assert pooled_recognizer is recognizer
+    assert recognizer.model is state.models[model_name][1]
+    state.release_recognizer("de", model_name, limited_str, recognizer)
+
+    # No longer in use, so both de and fr make room for it
+    await state.get_model("it")
+    assert list(state.models) == [MODELS["it"][0]]
+    assert not state.model_users
+
+
+@pytest.mark.asyncio
+async def test_unload_drops_cached_recognizers(make_state, tmp_path: Path) -> None:
+    state = make_state(
+        max_loaded_models=1,
+        **write_sentences(tmp_path, "de", "sentences:\n  - mach das licht an\n"),
+    )
+
+    model_name, limited_str, recognizer = await state.get_recognizer("de")
+    state.release_recognizer("de", model_name, limited_str, recognizer)
+    assert state.recognizer_pool[(model_name, "de")]
+    assert (model_name, "de") in state.limited_json
+
+    await state.get_model("fr")
+
+    assert model_name not in state.models
+    assert (model_name, "de") not in state.recognizer_pool
+    assert (model_name, "de") not in state.limited_json
+
+
+@pytest.mark.asyncio
+async def test_failed_load_keeps_models(make_state, monkeypatch) -> None:
+    state = make_state(max_loaded_models=1)
+    await state.get_model("de")
+
+    def fail_to_load(model_path: str) -> FakeModel:
+        raise RuntimeError(f"Failed to load {model_path}")
+
+    monkeypatch.setattr(vosk_main, "Model", fail_to_load)
+    with pytest.raises(RuntimeError):
+        await state.get_model("fr")
+
+    assert list(state.models) == [MODELS["de"][0]]
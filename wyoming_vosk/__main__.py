@@ -1,14 +1,15 @@
 #!/usr/bin/env python
 import argparse
 import asyncio
+import itertools
 import json
 import logging
-import sqlite3
 import sys
 import time
+from collections import defaultdict
 from functools import partial
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from text_to_num import alpha2digit
 from vosk import KaldiRecognizer, Model, SetLogLevel
@@ -20,28 +21,82 @@ from wyoming.server import AsyncEventHandler, AsyncServer
 
 from . import __version__
 from .download import CASING_FOR_MODEL, MODELS, UNK_FOR_MODEL, download_model
-from .sentences import correct_sentence, load_sentences_for_language
+from .sentences import LanguageConfig, correct_sentence, load_sentences_for_language
+
+try:
+    import orjson
+
+    _json_loads = orjson.loads  # pylint: disable=no-member
+
+    def _json_dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode("utf-8")  # pylint: disable=no-member
+
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj: Any) -> str:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
 
 _LOGGER = logging.getLogger()
 _DIR = Path(__file__).parent
 _CASING = {
-    "casefold": lambda s: s.casefold(),
-    "lower": lambda s: s.lower(),
-    "upper": lambda s: s.upper(),
+    "casefold": str.casefold,
+    "lower": str.lower,
+    "upper": str.upper,
     "keep": lambda s: s,
 }
 _DEFAULT_CASING = "casefold"
 _DEFAULT_UNK = "[unk]"
+_CLIENT_ID = itertools.count()
+_MODEL_ATTRIBUTION = Attribution(
+    name="Alpha Cephei",
+    url="https://alphacephei.com/vosk/models",
+)
+_ASR_MODELS = [
+    AsrModel(
+        name=model_name,
+        description=model_name.replace("vosk-model-", ""),
+        attribution=_MODEL_ATTRIBUTION,
+        installed=True,
+        version=None,
+        languages=[language],
+    )
+    for language, model_names in MODELS.items()
+    for model_name in model_names
+]
 
 
 class State:
     """State of system"""
 
-    def __init__(self, args: argparse.Namespace):
+    def __init__(self, args: argparse.Namespace, wyoming_info: Info):
         self.args = args
+
+        # Info doesn't change after startup
+        self.info_event = wyoming_info.event()
+
+        # Least recently used first
         self.models: Dict[str, Tuple[str, Model]] = {}
 
-    def get_model(
+        # Models for preloaded languages are never unloaded
+        self.pinned_models: Set[str] = set()
+
+        # model -> number of recognizers in use by clients
+        self.model_users: Dict[str, int] = {}
+
+        # Ensures each model is only downloaded/loaded once
+        self.model_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+        # (model, language) -> (sentences config, JSON list of allowed words)
+        self.limited_json: Dict[Tuple[str, str], Tuple[LanguageConfig, str]] = {}
+
+        # (model, language) -> [(limited JSON or None, idle recognizer)]
+        self.recognizer_pool: Dict[
+            Tuple[str, str], List[Tuple[Optional[str], KaldiRecognizer]]
+        ] = defaultdict(list)
+
+    async def get_model(
         self, language: str, model_name: Optional[str] = None
     ) -> Optional[Tuple[str, Model]]:
         # Allow override
@@ -56,28 +111,182 @@ class State:
 
         assert model_name is not None
 
-        name_and_model = self.models.get(model_name)
+        name_and_model = self.models.pop(model_name, None)
         if name_and_model is not None:
+            # Mark as most recently used
+            self.models[model_name] = name_and_model
             return name_and_model
 
-        # Check if model is already downloaded
-        for data_dir in self.args.data_dir:
-            model_dir = Path(data_dir) / model_name
-            if model_dir.is_dir():
+        async with self.model_locks[model_name]:
+            # Model may have been loaded for another client while waiting
+            name_and_model = self.models.get(model_name)
+            if name_and_model is not None:
+                return name_and_model
+
+            loop = asyncio.get_running_loop()
+
+            # Check if model is already downloaded
+            model_dir = self.args.model_dirs.get(model_name)
+            if model_dir is None:
+                # Not found at startup; may have been added since
+                for data_dir in self.args.data_dir:
+                    maybe_model_dir = Path(data_dir) / model_name
+                    if maybe_model_dir.is_dir():
+                        model_dir = maybe_model_dir
+                        break
+
+            if model_dir is not None:
                 _LOGGER.debug("Found %s at %s", model_name, model_dir)
-                model = Model(str(model_dir))
-                name_and_model = (model_name, model)
-                self.models[model_name] = name_and_model
+            else:
+                model_dir = await loop.run_in_executor(
+                    None, download_model, language, model_name, self.args.download_dir
+                )
 
-                return name_and_model
+            self.args.model_dirs[model_name] = model_dir
+            model = await loop.run_in_executor(None, Model, str(model_dir))
+
+            # Nothing is awaited between unloading and inserting, so concurrent
+            # loads can't both make room for themselves in the same slot.
+            self._unload_models()
+            name_and_model = (model_name, model)
+            self.models[model_name] = name_and_model
+
+            return name_and_model
+
+    def get_lang_config(self, language: str) -> Optional[LanguageConfig]:
+        """Loads user-provided sentences for a language, if available."""
+        if not self.args.sentences_dir:
+            return None
+
+        return load_sentences_for_language(
+            self.args.sentences_dir, language, self.args.database_dir
+        )
+
+    async def get_recognizer(
+        self, language: str, model_name: Optional[str] = None
+    ) -> Tuple[str, Optional[str], KaldiRecognizer]:
+        """Gets an idle Kaldi recognizer, optionally limited by user-provided sentences.
+
+        Returns model name, limited words JSON (None if open-ended), and recognizer.
+        """
+        name_and_model = await self.get_model(language, model_name)
+        assert (
+            name_and_model is not None
+        ), f"No model named: {model_name} for language: {language}"
+        model_name, model = name_and_model
+
+        # Keep model loaded while the recognizer is in use
+        self.model_users[model_name] = self.model_users.get(model_name, 0) + 1
+        try:
+            limited_str = self._get_limited_str(language, model_name)
+
+            # Reuse an idle recognizer with the same limited words
+            pool = self.recognizer_pool[(model_name, language)]
+            while pool:
+                pooled_str, recognizer = pool.pop()
+                if pooled_str is limited_str:
+                    return (model_name, limited_str, recognizer)
+
+            # Compiling a limited grammar may take a while
+            loop = asyncio.get_running_loop()
+            if limited_str is not None:
+                recognizer = await loop.run_in_executor(
+                    None, KaldiRecognizer, model, 16000, limited_str
+                )
+            else:
+                # Open-ended
+                recognizer = await loop.run_in_executor(
+                    None, KaldiRecognizer, model, 16000
+                )
+        except Exception:
+            self._remove_model_user(model_name)
+            raise
+
+        return (model_name, limited_str, recognizer)
 
-        model_dir = download_model(language, model_name, self.args.download_dir)
-        model = Model(str(model_dir))
+    def release_recognizer(
+        self,
+        language: str,
+        model_name: str,
+        limited_str: Optional[str],
+        recognizer: KaldiRecognizer,
+    ) -> None:
+        """Resets a recognizer and returns it to the pool."""
+        self._remove_model_user(model_name)
+        recognizer.Reset()
+        self.recognizer_pool[(model_name, language)].append((limited_str, recognizer))
+
+    def _remove_model_user(self, model_name: str) -> None:
+        """Marks a recognizer for the model as no longer in use."""
+        num_users = self.model_users.get(model_name, 0) - 1
+        if num_users > 0:
+            self.model_users[model_name] = num_users
+        else:
+            self.model_users.pop(model_name, None)
+
+    def _unload_models(self) -> None:
+        """Unloads least recently used models to make room for a new one."""
+        max_models = self.args.max_loaded_models
+        if max_models <= 0:
+            # No limit
+            return
+
+        for model_name in list(self.models):
+            if len(self.models) < max_models:
+                break
+
+            if (model_name in self.pinned_models) or (model_name in self.model_users):
+                # Preloaded or in use
+                continue
+
+            _LOGGER.debug("Unloading model: %s", model_name)
+            self.models.pop(model_name)
+
+            # Drop references to the model so it can be freed
+            for cache_key in list(self.recognizer_pool):
+                if cache_key[0] == model_name:
+                    self.recognizer_pool.pop(cache_key)
+
+            for cache_key in list(self.limited_json):
+                if cache_key[0] == model_name:
+                    self.limited_json.pop(cache_key)
+
+    def _get_limited_str(self, language: str, model_name: str) -> Optional[str]:
+        """Gets JSON list of words from user-provided sentences (None if open-ended)."""
+        if not self.args.limit_sentences:
+            return None
+
+        lang_config = self.get_lang_config(language)
+        if (lang_config is None) or (not lang_config.database_path.is_file()):
+            return None
+
+        cache_key = (model_name, language)
+        cached = self.limited_json.get(cache_key)
+        if (cached is not None) and (cached[0] is lang_config):
+            # Sentences haven't been reloaded since
+            return cached[1]
+
+        casing_func_name = CASING_FOR_MODEL.get(
+            model_name,
+            self.args.casing_for_language.get(language, _DEFAULT_CASING),
+        )
+        casing_func = _CASING[casing_func_name]
+        words = [casing_func(word) for word in lang_config.words]
 
-        name_and_model = (model_name, model)
-        self.models[model_name] = name_and_model
+        _LOGGER.debug(
+            "Limiting to %s possible word(s) with casing=%s",
+            len(words),
+            casing_func_name,
+        )
+
+        if self.args.allow_unknown:
+            # Enable unknown words (will return empty transcript)
+            words.append(casing_func(UNK_FOR_MODEL.get(model_name, _DEFAULT_UNK)))
 
-        return name_and_model
+        limited_str = _json_dumps(words)
+        self.limited_json[cache_key] = (lang_config, limited_str)
+
+        return limited_str
 
 
 async def main() -> None:
@@ -101,6 +310,13 @@ async def main() -> None:
         default=[],
         help="Preload model for language(s)",
     )
+    parser.add_argument(
+        "--max-loaded-models",
+        type=int,
+        default=0,
+        help="Unload least recently used models beyond this many "
+        "(default: 0 = no limit, preloaded models are always kept)",
+    )
     parser.add_argument(
         "--model-for-language",
         nargs=2,
@@ -168,6 +384,10 @@ async def main() -> None:
             )
             sys.exit(1)
 
+    if args.max_loaded_models < 0:
+        _LOGGER.fatal("--max-loaded-models must be 0 or greater")
+        sys.exit(1)
+
     if not args.download_dir:
         # Download to first data dir by default
         args.download_dir = args.data_dir[0]
@@ -175,6 +395,16 @@ async def main() -> None:
     if not args.database_dir:
         args.database_dir = args.sentences_dir
 
+    # Index downloaded models (earlier data dirs take precedence)
+    args.model_dirs = {}
+    for data_dir in map(Path, args.data_dir):
+        if not data_dir.is_dir():
+            continue
+
+        for model_dir in data_dir.iterdir():
+            if model_dir.is_dir():
+                args.model_dirs.setdefault(model_dir.name, model_dir)
+
     # Convert to dict of language -> model
     args.model_for_language = dict(args.model_for_language)
 
@@ -201,30 +431,20 @@ async def main() -> None:
                 ),
                 installed=True,
                 version=__version__,
-                models=[
-                    AsrModel(
-                        name=model_name,
-                        description=model_name.replace("vosk-model-", ""),
-                        attribution=Attribution(
-                            name="Alpha Cephei",
-                            url="https://alphacephei.com/vosk/models",
-                        ),
-                        installed=True,
-                        version=None,
-                        languages=[language],
-                    )
-                    for language, model_names in MODELS.items()
-                    for model_name in model_names
-                ],
+                models=_ASR_MODELS,
             )
         ],
     )
 
-    state = State(args)
+    state = State(args, wyoming_info)
     for language in args.preload_language:
         _LOGGER.debug("Preloading model for %s", language)
-        state.get_model(language)
-        load_sentences_for_language(args.sentences_dir, language, args.database_dir)
+        state.get_lang_config(language)
+        model_name, limited_str, recognizer = await state.get_recognizer(language)
+        state.pinned_models.add(model_name)
+
+        # Leave idle recognizer in the pool for the first client
+        state.release_recognizer(language, model_name, limited_str, recognizer)
 
     _LOGGER.info("Ready")
 
@@ -232,7 +452,7 @@ async def main() -> None:
     server = AsyncServer.from_uri(args.uri)
 
     try:
-        await server.run(partial(VoskEventHandler, wyoming_info, args, state))
+        await server.run(partial(VoskEventHandler, args, state))
     except KeyboardInterrupt:
         pass
 
@@ -245,7 +465,6 @@ class VoskEventHandler(AsyncEventHandler):
 
     def __init__(
         self,
-        wyoming_info: Info,
         cli_args: argparse.Namespace,
         state: State,
         *args,
@@ -254,14 +473,15 @@ class VoskEventHandler(AsyncEventHandler):
         super().__init__(*args, **kwargs)
 
         self.cli_args = cli_args
-        self.wyoming_info_event = wyoming_info.event()
-        self.client_id = str(time.monotonic_ns())
+        self.wyoming_info_event = state.info_event
+        self.client_id = f"c{next(_CLIENT_ID)}"
         self.state = state
         self.converter = AudioChunkConverter(rate=16000, width=2, channels=1)
-        self.audio_buffer = bytes()
         self.language: Optional[str] = None
         self.model_name: Optional[str] = None
+        self.unk_token = _DEFAULT_UNK
         self.recognizer: Optional[KaldiRecognizer] = None
+        self.limited_str: Optional[str] = None
 
         _LOGGER.debug("Client connected: %s", self.client_id)
 
@@ -283,31 +503,38 @@ class VoskEventHandler(AsyncEventHandler):
             if self.recognizer is None:
                 # Load recognizer on first audio chunk
                 self.language = self.language or self.cli_args.language
-                name_and_model = self.state.get_model(self.language, self.model_name)
-                assert (
-                    name_and_model is not None
-                ), f"No model named: {self.model_name} for language: {self.language}"
-                self.model_name, model = name_and_model
 
                 start_time = time.monotonic()
-                self.recognizer = self._load_recognizer(model)
+                (
+                    self.model_name,
+                    self.limited_str,
+                    self.recognizer,
+                ) = await self.state.get_recognizer(self.language, self.model_name)
+                self.unk_token = UNK_FOR_MODEL.get(self.model_name, _DEFAULT_UNK)
                 end_time = time.monotonic()
                 _LOGGER.debug(
                     "Loaded recognizer in %0.2f second(s)", end_time - start_time
                 )
 
-            assert self.recognizer is not None
-
             # Process audio chunk
             chunk = AudioChunk.from_event(event)
-            chunk = self.converter.convert(chunk)
-            self.recognizer.AcceptWaveform(chunk.audio)
+            # Convert and decode outside the event loop so other clients
+            # aren't blocked
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._accept_chunk, self.recognizer, chunk
+            )
 
         elif AudioStop.is_type(event.type):
             # Get transcript
             assert self.recognizer is not None
-            result = json.loads(self.recognizer.FinalResult())
-            text = alpha2digit(result["text"], self.language)
+            result = _json_loads(
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.recognizer.FinalResult
+                )
+            )
+            text = result.get("text", "")
+            if text:
+                text = alpha2digit(text, self.language)
             _LOGGER.debug("Transcript for client %s: %s", self.client_id, text)
 
             if self.cli_args.correct_sentences is not None:
@@ -327,55 +554,22 @@ class VoskEventHandler(AsyncEventHandler):
     async def disconnect(self) -> None:
         _LOGGER.debug("Client disconnected: %s", self.client_id)
 
-    def _load_recognizer(self, model: Model) -> KaldiRecognizer:
-        """Loads Kaldi recognizer for the model, optionally limited by user-provided sentences."""
-        if self.cli_args.limit_sentences:
-            assert self.language, "Language not set"
-            lang_config = load_sentences_for_language(
-                self.cli_args.sentences_dir,
-                self.language,
-                self.cli_args.database_dir,
+        if (self.recognizer is not None) and self.model_name and self.language:
+            # Return recognizer to the pool for the next client
+            self.state.release_recognizer(
+                self.language, self.model_name, self.limited_str, self.recognizer
             )
-            if (lang_config is not None) and lang_config.database_path.is_file():
-                words: List[str] = []
-                with sqlite3.connect(str(lang_config.database_path)) as db_conn:
-                    cursor = db_conn.execute("SELECT word from WORDS")
-                    for row in cursor:
-                        words.append(row[0])
-
-                casing_func_name = CASING_FOR_MODEL.get(
-                    self.model_name,
-                    self.cli_args.casing_for_language.get(
-                        self.language, _DEFAULT_CASING
-                    ),
-                )
-                _LOGGER.debug(
-                    "Limiting to %s possible word(s) with casing=%s",
-                    len(words),
-                    casing_func_name,
-                )
-
-                if self.cli_args.allow_unknown:
-                    # Enable unknown words (will return empty transcript)
-                    words.append(UNK_FOR_MODEL.get(self.model_name, _DEFAULT_UNK))
-
-                casing_func = _CASING[casing_func_name]
-                limited_str = json.dumps(
-                    [casing_func(w) for w in words], ensure_ascii=False
-                )
-                return KaldiRecognizer(model, 16000, limited_str)
+            self.recognizer = None
 
-        # Open-ended
-        return KaldiRecognizer(model, 16000)
+    def _accept_chunk(self, recognizer: KaldiRecognizer, chunk: AudioChunk) -> None:
+        """Converts audio chunk if needed and feeds it to the recognizer."""
+        chunk = self.converter.convert(chunk)
+        recognizer.AcceptWaveform(chunk.audio)
 
     def _fix_transcript(self, text: str) -> str:
         """Corrects a transcript using user-provided sentences."""
         assert self.language, "Language not set"
-        lang_config = load_sentences_for_language(
-            self.cli_args.sentences_dir,
-            self.language,
-            self.cli_args.database_dir,
-        )
+        lang_config = self.state.get_lang_config(self.language)
 
         if self.cli_args.allow_unknown and self._has_unknown(text):
             if lang_config is not None:
@@ -393,8 +587,11 @@ class VoskEventHandler(AsyncEventHandler):
 
     def _has_unknown(self, text: str) -> bool:
         """Return true if text contains unknown token."""
-        unk_token = UNK_FOR_MODEL.get(self.model_name, _DEFAULT_UNK)
-        return (text == unk_token) or (unk_token in text.split())
+        if self.unk_token not in text:
+            # Avoid splitting when token can't be present
+            return False
+
+        return (text == self.unk_token) or (self.unk_token in text.split())
 
 
 # -----------------------------------------------------------------------------
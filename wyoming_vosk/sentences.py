@@ -22,12 +22,33 @@ class LanguageConfig:
     sentences_mtime_ns: int
     sentences_file_size: int
     database_path: Path
+    words: List[str] = field(default_factory=list)
     no_correct_patterns: List[re.Pattern] = field(default_factory=list)
     unknown_text: Optional[str] = None
+    _db_conn: Optional[sqlite3.Connection] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    def get_db_conn(self) -> sqlite3.Connection:
+        """Get read-only connection to the sentences database (opened once)."""
+        if self._db_conn is None:
+            self._db_conn = sqlite3.connect(
+                f"{self.database_path.absolute().as_uri()}?mode=ro",
+                uri=True,
+                check_same_thread=False,
+            )
+
+        return self._db_conn
 
+    def close_db_conn(self) -> None:
+        """Close connection to the sentences database, if open."""
+        if self._db_conn is not None:
+            self._db_conn.close()
+            self._db_conn = None
 
-# language -> config
-_CONFIG_CACHE: Dict[str, LanguageConfig] = {}
+
+# (sentences_dir, language, database_dir) -> config
+_CONFIG_CACHE: Dict[Tuple[str, str, str], LanguageConfig] = {}
 
 
 def load_sentences_for_language(
@@ -39,7 +60,8 @@ def load_sentences_for_language(
         return None
 
     sentences_stats = sentences_path.stat()
-    config = _CONFIG_CACHE.get(language)
+    cache_key = (str(sentences_dir), language, str(database_dir))
+    config = _CONFIG_CACHE.get(cache_key)
 
     # We will reload if the file modification time or size has changed
     if (
@@ -50,6 +72,10 @@ def load_sentences_for_language(
         # Cache hit
         return config
 
+    if config is not None:
+        # Database will be regenerated
+        config.close_db_conn()
+
     try:
         import yaml
     except ImportError as exc:
@@ -100,14 +126,17 @@ def load_sentences_for_language(
             "CREATE TABLE words " + "(id INTEGER PRIMARY KEY AUTOINCREMENT, word TEXT);"
         )
         db_conn.commit()
-        generate_sentences(sentences_yaml, db_conn)
+        config.words = list(generate_sentences(sentences_yaml, db_conn))
 
-    _CONFIG_CACHE[language] = config
+    _CONFIG_CACHE[cache_key] = config
 
     return config
 
 
-def generate_sentences(sentences_yaml: Dict[str, Any], db_conn: sqlite3.Connection):
+def generate_sentences(
+    sentences_yaml: Dict[str, Any], db_conn: sqlite3.Connection
+) -> Set[str]:
+    """Generate sentences from templates into the database, returning unique words."""
     try:
         import hassil.parse_expression
         import hassil.sample
@@ -241,6 +270,8 @@ def generate_sentences(sentences_yaml: Dict[str, Any], db_conn: sqlite3.Connecti
         end_time - start_time,
     )
 
+    return words
+
 
 def sample_expression_with_output(
     expression: "Expression",
@@ -360,33 +391,33 @@ def correct_sentence(
         if pattern.match(text):
             return text
 
-    with sqlite3.connect(str(config.database_path)) as db_conn:
-        try:
-            from rapidfuzz.distance import Levenshtein
-            from rapidfuzz.process import extractOne
-        except ImportError as exc:
-            raise Exception("pip3 install wyoming-vosk[limited]") from exc
-
-        cursor = db_conn.execute("SELECT input_text, output_text from sentences")
-        result = extractOne(
-            [text],  # critical that this is a list
-            cursor,
-            processor=lambda s: s[0],
-            scorer=Levenshtein.distance,
-            scorer_kwargs={"weights": (1, 1, 3)},
-        )
-        fixed_row, score = result[0], result[1]
+    try:
+        from rapidfuzz.distance import Levenshtein
+        from rapidfuzz.process import extractOne
+    except ImportError as exc:
+        raise Exception("pip3 install wyoming-vosk[limited]") from exc
 
-        final_text = text
-        if (score_cutoff <= 0) or (score <= score_cutoff):
-            # Map to output text
-            final_text = fixed_row[1]
+    db_conn = config.get_db_conn()
+    cursor = db_conn.execute("SELECT input_text, output_text from sentences")
+    result = extractOne(
+        [text],  # critical that this is a list
+        cursor,
+        processor=lambda s: s[0],
+        scorer=Levenshtein.distance,
+        scorer_kwargs={"weights": (1, 1, 3)},
+    )
+    fixed_row, score = result[0], result[1]
 
-        _LOGGER.debug(
-            "score=%s/%s, original=%s, final=%s", score, score_cutoff, text, final_text
-        )
+    final_text = text
+    if (score_cutoff <= 0) or (score <= score_cutoff):
+        # Map to output text
+        final_text = fixed_row[1]
+
+    _LOGGER.debug(
+        "score=%s/%s, original=%s, final=%s", score, score_cutoff, text, final_text
+    )
 
-        return final_text
+    return final_text
 
 
 # -----------------------------------------------------------------------------